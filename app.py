@@ -3,14 +3,18 @@ FastAPI Backend for RAG2 - AI Research Paper Assistant
 Provides REST API endpoints for paper ingestion and querying
 """
 
+import asyncio
 import os
 import sys
+from contextlib import asynccontextmanager
 from pathlib import Path
-from typing import List, Optional
+from typing import Dict, List, Optional
 from dotenv import load_dotenv
+import aiofiles
 
 from fastapi import FastAPI, File, UploadFile, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
 from pydantic import BaseModel
 import uvicorn
 
@@ -18,15 +22,32 @@ import uvicorn
 sys.path.append(str(Path(__file__).parent / 'src'))
 
 from rag_pipeline import RAGPipeline
+from semantic_cache import SemanticCache
 
 # Load environment variables
 load_dotenv()
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Load the RAG pipeline and query cache once per worker, at startup"""
+    pipeline = RAGPipeline()
+    app.state.pipeline = pipeline
+    # Answers for semantically similar questions
+    app.state.query_cache = SemanticCache(
+        dimension=pipeline.embedding_generator.get_dimension(),
+        threshold=float(os.getenv('SEMANTIC_CACHE_THRESHOLD', 0.95)),
+        max_entries=int(os.getenv('SEMANTIC_CACHE_SIZE', 1024))
+    )
+    yield
+
+
 # Initialize FastAPI app
 app = FastAPI(
     title="RAG2 - AI Research Paper Assistant",
     description="Upload research papers and ask questions using RAG",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=ORJSONResponse,
+    lifespan=lifespan
 )
 
 # CORS configuration - allow frontend to access API
@@ -39,18 +60,33 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Initialize RAG pipeline (singleton)
-rag_pipeline = None
 papers_dir = Path('data/papers')
 papers_dir.mkdir(parents=True, exist_ok=True)
 
+# In-memory index of uploaded papers (filename -> size in bytes), kept in
+# sync by the upload/delete handlers so requests don't rescan the directory
+papers_index: Dict[str, int] = {}
+
+
+def refresh_papers_index():
+    """Rebuild the papers index from data/papers/"""
+    # scandir entries cache their stat results, avoiding a separate stat per file
+    with os.scandir(papers_dir) as entries:
+        found = {
+            entry.name: entry.stat().st_size
+            for entry in entries
+            if entry.name.endswith('.pdf') and entry.is_file()
+        }
+    papers_index.clear()
+    papers_index.update(found)
+
+
+refresh_papers_index()
+
 
-def get_pipeline():
-    """Get or create RAG pipeline instance"""
-    global rag_pipeline
-    if rag_pipeline is None:
-        rag_pipeline = RAGPipeline()
-    return rag_pipeline
+def invalidate_query_cache():
+    """Drop cached answers after the paper collection changes"""
+    app.state.query_cache.clear()
 
 
 # Request/Response models
@@ -92,15 +128,14 @@ async def root():
     }
 
 
-@app.get("/api/health", response_model=HealthResponse)
+@app.get("/api/health", response_model=HealthResponse, response_model_exclude_none=True)
 async def health_check():
     """Health check endpoint"""
     try:
-        pdf_files = list(papers_dir.glob('*.pdf'))
         return HealthResponse(
             status="healthy",
             message="API is running",
-            papers_count=len(pdf_files)
+            papers_count=len(papers_index)
         )
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -110,13 +145,12 @@ async def health_check():
 async def list_papers():
     """List all uploaded papers"""
     try:
-        pdf_files = list(papers_dir.glob('*.pdf'))
         papers = [
             PaperInfo(
-                filename=pdf.name,
-                size_bytes=pdf.stat().st_size
+                filename=filename,
+                size_bytes=size_bytes
             )
-            for pdf in pdf_files
+            for filename, size_bytes in papers_index.items()
         ]
         return papers
     except Exception as e:
@@ -140,22 +174,28 @@ async def upload_paper(file: UploadFile = File(...)):
                 detail="Only PDF files are allowed"
             )
         
-        # Save file
+        # Stream file to disk in 1 MB pieces instead of buffering it whole
         file_path = papers_dir / file.filename
-        content = await file.read()
+        size_bytes = 0
         
-        with open(file_path, 'wb') as f:
-            f.write(content)
+        async with aiofiles.open(file_path, 'wb') as f:
+            while chunk := await file.read(1 << 20):
+                await f.write(chunk)
+                size_bytes += len(chunk)
+        papers_index[file.filename] = size_bytes
         
-        # Ingest the paper
-        pipeline = get_pipeline()
-        pipeline.ingest_papers([str(file_path)])
+        # Ingest the paper without blocking the event loop
+        pipeline = app.state.pipeline
+        await asyncio.get_running_loop().run_in_executor(
+            None, pipeline.ingest_papers, [str(file_path)]
+        )
+        invalidate_query_cache()
         
         return {
             "status": "success",
             "message": f"Paper '{file.filename}' uploaded and ingested successfully",
             "filename": file.filename,
-            "size_bytes": len(content)
+            "size_bytes": size_bytes
         }
     
     except HTTPException:
@@ -164,7 +204,9 @@ async def upload_paper(file: UploadFile = File(...)):
         raise HTTPException(status_code=500, detail=f"Upload failed: {str(e)}")
 
 
-@app.post("/api/query", response_model=QueryResponse)
+# Sources are already plain dicts, so skip response_model validation and keep
+# QueryResponse only for the OpenAPI schema
+@app.post("/api/query", responses={200: {"model": QueryResponse}})
 async def query_papers(request: QueryRequest):
     """
     Ask a question about the uploaded papers
@@ -178,21 +220,28 @@ async def query_papers(request: QueryRequest):
             raise HTTPException(status_code=400, detail="Question cannot be empty")
         
         # Check if any papers are uploaded
-        pdf_files = list(papers_dir.glob('*.pdf'))
-        if not pdf_files:
+        if not papers_index:
             raise HTTPException(
                 status_code=400,
                 detail="No papers uploaded. Please upload at least one PDF first."
             )
         
-        # Query the RAG pipeline
-        pipeline = get_pipeline()
-        result = pipeline.query(request.question)
+        # Serve paraphrased repeats from the semantic cache
+        pipeline = app.state.pipeline
+        question_embedding = await asyncio.to_thread(pipeline.embed_question, request.question)
+        query_cache = app.state.query_cache
+        result = query_cache.get(question_embedding)
         
-        return QueryResponse(
-            answer=result['answer'],
-            sources=result['sources']
-        )
+        if result is None:
+            result = await pipeline.aquery(request.question, question_embedding)
+            # Fallback answers (e.g. after an LLM error) are not worth reusing
+            if result['generated']:
+                query_cache.put(question_embedding, result)
+        
+        return ORJSONResponse({
+            "answer": result['answer'],
+            "sources": result['sources']
+        })
     
     except HTTPException:
         raise
@@ -207,7 +256,9 @@ async def ingest_all_papers():
     Useful for re-indexing or initial setup
     """
     try:
-        pdf_files = list(papers_dir.glob('*.pdf'))
+        # Pick up PDFs copied into data/papers/ outside the API
+        refresh_papers_index()
+        pdf_files = [papers_dir / filename for filename in papers_index]
         
         if not pdf_files:
             return {
@@ -216,8 +267,12 @@ async def ingest_all_papers():
                 "papers_ingested": 0
             }
         
-        pipeline = get_pipeline()
-        pipeline.ingest_papers([str(p) for p in pdf_files])
+        # Ingestion is CPU-bound; keep the event loop free while it runs
+        pipeline = app.state.pipeline
+        await asyncio.get_running_loop().run_in_executor(
+            None, pipeline.ingest_papers, [str(p) for p in pdf_files]
+        )
+        invalidate_query_cache()
         
         return {
             "status": "success",
@@ -243,6 +298,8 @@ async def delete_paper(filename: str):
         
         # Delete the file
         file_path.unlink()
+        papers_index.pop(filename, None)
+        invalidate_query_cache()
         
         return {
             "status": "success",
@@ -261,7 +318,9 @@ async def delete_all_papers():
     Delete all papers from data/papers/
     """
     try:
-        pdf_files = list(papers_dir.glob('*.pdf'))
+        # Include PDFs copied into data/papers/ outside the API
+        refresh_papers_index()
+        pdf_files = [papers_dir / filename for filename in papers_index]
         
         if not pdf_files:
             return {
@@ -272,7 +331,9 @@ async def delete_all_papers():
         
         # Delete all PDF files
         for pdf in pdf_files:
-            pdf.unlink()
+            pdf.unlink(missing_ok=True)
+        papers_index.clear()
+        invalidate_query_cache()
         
         return {
             "status": "success",
@@ -294,9 +355,23 @@ if __name__ == "__main__":
     print("\n📡 Server starting at http://localhost:8000")
     print("📖 API docs: http://localhost:8000/docs\n")
     
-    uvicorn.run(
-        "app:app",
-        host="0.0.0.0",
-        port=8000,
-        reload=True
-    )
+    if os.getenv("DEV") == "1":
+        # Development: single process with auto-reload
+        uvicorn.run(
+            "app:app",
+            host="0.0.0.0",
+            port=8000,
+            reload=True
+        )
+    else:
+        # Production: no reload; uvloop/httptools when installed (uvicorn[standard]).
+        # Each worker holds its own pipeline, paper index and caches, so only
+        # raise WORKERS when Endee (not the in-memory fallback) stores vectors.
+        uvicorn.run(
+            "app:app",
+            host="0.0.0.0",
+            port=8000,
+            workers=int(os.getenv("WORKERS", 1)),
+            loop="auto",
+            http="httptools"
+        )
@@ -0,0 +1,76 @@
+//! Native implementation of `Chunker._split_text_with_overlap`.
+//!
+//! Produces exactly the same chunks as the Python splitter: windows of
+//! `chunk_size` characters that end after the last sentence terminator
+//! (`.`, `!` or `?` followed by a space) past the 50% mark, stripped of
+//! surrounding whitespace, with `overlap` characters carried into the next
+//! window. Lengths are counted in characters, not bytes, to match `str`.
+
+use memchr::memchr3_iter;
+use pyo3::prelude::*;
+
+/// Whitespace as defined by Python's `str.isspace`.
+fn is_py_space(c: char) -> bool {
+    c.is_whitespace() || ('\x1c'..='\x1f').contains(&c)
+}
+
+/// Split `text` into overlapping, sentence-aligned chunks.
+#[pyfunction]
+fn split_with_overlap(text: &str, chunk_size: usize, overlap: usize) -> Vec<String> {
+    let bytes = text.as_bytes();
+
+    // Byte offset of every character (plus the end), only needed for non-ASCII text
+    let offsets: Option<Vec<usize>> = if text.is_ascii() {
+        None
+    } else {
+        Some(text.char_indices().map(|(i, _)| i).chain(std::iter::once(bytes.len())).collect())
+    };
+    let to_byte = |ci: usize| offsets.as_ref().map_or(ci, |o| o[ci]);
+    let to_char = |bi: usize| offsets.as_ref().map_or(bi, |o| o.binary_search(&bi).unwrap());
+    let text_len = offsets.as_ref().map_or(bytes.len(), |o| o.len() - 1);
+
+    // Character offsets just past each sentence terminator that is followed by a space
+    let boundaries: Vec<usize> = memchr3_iter(b'.', b'!', b'?', bytes)
+        .filter(|&p| bytes.get(p + 1) == Some(&b' '))
+        .map(|p| to_char(p) + 1)
+        .collect();
+
+    let mut chunks = Vec::new();
+    let mut start = 0;
+
+    while start < text_len {
+        let mut end = start + chunk_size;
+
+        if end < text_len {
+            // Last boundary whose trailing space still falls inside the window
+            let i = boundaries.partition_point(|&b| b <= end - 1);
+            if i > 0 {
+                let cut = boundaries[i - 1];
+                if cut > start && (cut - 1 - start) as f64 > chunk_size as f64 * 0.5 {
+                    end = cut;
+                }
+            }
+        }
+
+        let end_clamped = end.min(text_len);
+        let chunk = text[to_byte(start)..to_byte(end_clamped)].trim_matches(is_py_space);
+        if !chunk.is_empty() {
+            chunks.push(chunk.to_owned());
+        }
+
+        // Move start forward with overlap, always making progress
+        start = if end < text_len {
+            end.saturating_sub(overlap).max(start + 1)
+        } else {
+            text_len
+        };
+    }
+
+    chunks
+}
+
+#[pymodule]
+fn chunker_native(m: &Bound<'_, PyModule>) -> PyResult<()> {
+    m.add_function(wrap_pyfunction!(split_with_overlap, m)?)?;
+    Ok(())
+}
@@ -3,9 +3,16 @@ Chunker Module
 Splits documents into semantic chunks with metadata preservation
 """
 
+from bisect import bisect_right
 from typing import Dict, List
 import re
 
+# Optional Rust splitter (see native/); the Python implementation is used otherwise
+try:
+    from chunker_native import split_with_overlap as _native_split
+except ImportError:
+    _native_split = None
+
 
 class Chunker:
     """Section-aware document chunking"""
@@ -20,6 +27,30 @@ class Chunker:
         """
         self.chunk_size = chunk_size
         self.chunk_overlap = chunk_overlap
+        self._sent_re = re.compile(r'[.!?] ')
+        
+        # Without overlap consecutive windows never revisit text, so the whole
+        # split can run as a single regex scan (see _compile_window_regex)
+        self._window_re = self._compile_window_regex(chunk_size) if chunk_overlap == 0 else None
+    
+    @staticmethod
+    def _compile_window_regex(chunk_size: int) -> re.Pattern:
+        """
+        Build a regex whose successive matches are the non-overlapping windows
+        
+        While more than chunk_size characters remain, a window ends after the
+        last sentence terminator (followed by a space) past the 50% mark, or
+        is cut at chunk_size; the remainder becomes the final window.
+        """
+        min_prefix = chunk_size // 2 + 1
+        max_prefix = chunk_size - 2
+        hard_cut = r'.{1,%d}' % chunk_size
+        if min_prefix > max_prefix:
+            return re.compile(hard_cut, re.DOTALL)
+        return re.compile(
+            r'(?=.{%d}).{%d,%d}[.!?](?= )|%s' % (chunk_size + 1, min_prefix, max_prefix, hard_cut),
+            re.DOTALL
+        )
     
     def chunk_document(self, document: Dict) -> List[Dict]:
         """
@@ -46,8 +77,13 @@ class Chunker:
         paper_name = document['metadata']['filename']
         
         for section in document['sections']:
+            # Skip empty/whitespace-only sections (headers, footers) without copying them
+            raw_text = section['text']
+            if not raw_text or raw_text.isspace():
+                continue
+            
             section_name = section['section_name']
-            section_text = section['text'].strip()
+            section_text = raw_text.strip()
             page_start = section['page_start']
             page_end = section['page_end']
             
@@ -98,27 +134,30 @@ class Chunker:
         Returns:
             List of text chunks
         """
+        if _native_split is not None:
+            return _native_split(text, chunk_size, overlap)
+        
+        if overlap == 0 and chunk_size == self.chunk_size and self._window_re is not None:
+            return [chunk for chunk in map(str.strip, self._window_re.findall(text)) if chunk]
+        
         chunks = []
         start = 0
         text_len = len(text)
         
+        # Offsets just past every sentence-ending punctuation mark, found in one scan
+        boundaries = [m.start() + 1 for m in self._sent_re.finditer(text)]
+        
         while start < text_len:
             end = start + chunk_size
             
             # Try to break at sentence boundary
             if end < text_len:
-                # Look for sentence ending
-                chunk_text = text[start:end]
-                
-                # Find last period, exclamation, or question mark
-                last_sentence_end = max(
-                    chunk_text.rfind('. '),
-                    chunk_text.rfind('! '),
-                    chunk_text.rfind('? ')
-                )
+                # Last boundary whose trailing space still falls inside the window
+                i = bisect_right(boundaries, end - 1) - 1
                 
-                if last_sentence_end > chunk_size * 0.5:  # At least 50% of chunk size
-                    end = start + last_sentence_end + 1
+                # At least 50% of chunk size
+                if i >= 0 and boundaries[i] - 1 - start > chunk_size * 0.5:
+                    end = boundaries[i]
             
             chunk = text[start:end].strip()
             if chunk:
@@ -3,12 +3,148 @@ Embeddings Module
 Generate vector embeddings from text chunks
 """
 
+import asyncio
+import hashlib
 import os
+import threading
+from pathlib import Path
 from typing import List, Union
 from sentence_transformers import SentenceTransformer
 import numpy as np
 
 
+def _cosine_kernel(a: np.ndarray, b: np.ndarray) -> float:
+    """Single-pass cosine similarity over two 1-D float32 arrays"""
+    dot = 0.0
+    norm_a = 0.0
+    norm_b = 0.0
+    for i in range(a.size):
+        dot += a[i] * b[i]
+        norm_a += a[i] * a[i]
+        norm_b += b[i] * b[i]
+    if norm_a == 0.0 or norm_b == 0.0:
+        return 0.0
+    return dot / np.sqrt(norm_a * norm_b)
+
+
+# JIT-compile the kernel when Numba is available; otherwise NumPy is used
+try:
+    from numba import njit
+    _cosine = njit(cache=True, fastmath=True)(_cosine_kernel)
+except ImportError:
+    _cosine = None
+
+
+class ONNXEncoder:
+    """
+    INT8-quantized ONNX Runtime encoder with a SentenceTransformer-compatible API
+    
+    The model is exported once with optimum and dynamically quantized with
+    onnxruntime; later runs load the cached quantized graph directly.
+    """
+    
+    def __init__(self, model_name: str, cache_dir: str = None, max_seq_length: int = 256):
+        """
+        Initialize ONNX encoder
+        
+        Args:
+            model_name: Sentence Transformers model name or Hugging Face model id
+            cache_dir: Directory holding exported ONNX models
+            max_seq_length: Maximum number of tokens per text
+        """
+        try:
+            import onnxruntime as ort
+            from onnxruntime.quantization import quantize_dynamic, QuantType
+            from transformers import AutoTokenizer
+        except ImportError:
+            raise Exception(
+                "ONNX backend not installed. Run: pip install optimum[onnxruntime] transformers"
+            )
+        
+        model_id = model_name if '/' in model_name else f"sentence-transformers/{model_name}"
+        cache_dir = cache_dir or os.getenv('ONNX_CACHE_DIR', '.cache/onnx')
+        export_dir = Path(cache_dir) / model_id.replace('/', '__')
+        quantized_path = export_dir / 'model_int8.onnx'
+        
+        if not quantized_path.exists():
+            from optimum.onnxruntime import ORTModelForFeatureExtraction
+            
+            print(f"Exporting {model_id} to ONNX (one-time)...")
+            ORTModelForFeatureExtraction.from_pretrained(model_id, export=True).save_pretrained(export_dir)
+            quantize_dynamic(
+                str(export_dir / 'model.onnx'),
+                str(quantized_path),
+                weight_type=QuantType.QInt8
+            )
+        
+        self.tokenizer = AutoTokenizer.from_pretrained(model_id)
+        self.max_seq_length = max_seq_length
+        self.session = ort.InferenceSession(
+            str(quantized_path),
+            providers=['CPUExecutionProvider']
+        )
+        self.input_names = {i.name for i in self.session.get_inputs()}
+        self.dimension = self.encode(["dimension probe"]).shape[1]
+    
+    def get_sentence_embedding_dimension(self) -> int:
+        """Get the dimension of embeddings produced by this encoder"""
+        return self.dimension
+    
+    def encode(
+        self,
+        sentences: Union[str, List[str]],
+        batch_size: int = 32,
+        show_progress_bar: bool = False,
+        convert_to_numpy: bool = True,
+        normalize_embeddings: bool = False
+    ) -> np.ndarray:
+        """
+        Encode texts into mean-pooled sentence embeddings
+        
+        Args:
+            sentences: Text or list of texts
+            batch_size: Batch size for inference
+            show_progress_bar: Show a tqdm progress bar
+            convert_to_numpy: Accepted for API compatibility; output is always numpy
+            normalize_embeddings: L2-normalize the output vectors
+            
+        Returns:
+            float32 array of shape (dimension,) or (len(sentences), dimension)
+        """
+        single = isinstance(sentences, str)
+        if single:
+            sentences = [sentences]
+        
+        starts = range(0, len(sentences), batch_size)
+        if show_progress_bar:
+            from tqdm import tqdm
+            starts = tqdm(starts, desc="Batches")
+        
+        batches = []
+        for i in starts:
+            encoded = self.tokenizer(
+                sentences[i:i+batch_size],
+                padding=True,
+                truncation=True,
+                max_length=self.max_seq_length,
+                return_tensors='np'
+            )
+            feeds = {k: v.astype(np.int64) for k, v in encoded.items() if k in self.input_names}
+            token_embeddings = self.session.run(None, feeds)[0]
+            
+            # Mean pooling over non-padding tokens
+            mask = encoded['attention_mask'][..., None].astype(np.float32)
+            summed = (token_embeddings * mask).sum(axis=1)
+            batches.append(summed / np.clip(mask.sum(axis=1), 1e-9, None))
+        
+        embeddings = np.concatenate(batches).astype(np.float32, copy=False)
+        if normalize_embeddings:
+            norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+            embeddings /= np.clip(norms, 1e-12, None)
+        
+        return embeddings[0] if single else embeddings
+
+
 class EmbeddingGenerator:
     """Generate embeddings using Sentence Transformers or OpenAI"""
     
@@ -21,21 +157,38 @@ class EmbeddingGenerator:
             model_name: Specific model to use
         """
         self.provider = provider or os.getenv('EMBEDDING_MODEL', 'sentence-transformers')
+        self.backend = 'api'
+        
+        # Background event loop for API providers, created on first use
+        self._loop = None
+        self._loop_lock = threading.Lock()
         
         if self.provider == 'sentence-transformers':
             self.model_name = model_name or os.getenv(
                 'SENTENCE_TRANSFORMER_MODEL',
                 'all-MiniLM-L6-v2'
             )
-            print(f"Loading embedding model: {self.model_name}...")
-            self.model = SentenceTransformer(self.model_name)
+            self.backend = os.getenv('EMBEDDING_BACKEND', 'torch')
+            print(f"Loading embedding model: {self.model_name} ({self.backend})...")
+            if self.backend == 'onnx':
+                self.model = ONNXEncoder(self.model_name)
+            else:
+                self.model = SentenceTransformer(self.model_name)
             self.dimension = self.model.get_sentence_embedding_dimension()
             print(f"✓ Model loaded. Embedding dimension: {self.dimension}")
             
         elif self.provider == 'openai':
             try:
-                from openai import OpenAI
-                self.client = OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
+                import httpx
+                from openai import AsyncOpenAI
+                # One pooled HTTP/2 client shared by every request from this generator
+                self.client = AsyncOpenAI(
+                    api_key=os.getenv('OPENAI_API_KEY'),
+                    http_client=httpx.AsyncClient(
+                        http2=True,
+                        limits=httpx.Limits(max_connections=64)
+                    )
+                )
                 self.model_name = model_name or 'text-embedding-3-small'
                 self.dimension = 1536  # Default for OpenAI embeddings
                 print(f"✓ OpenAI embeddings configured: {self.model_name}")
@@ -59,8 +212,49 @@ class EmbeddingGenerator:
         
         else:
             raise ValueError(f"Unsupported embedding provider: {self.provider}")
+        
+        self._init_cache()
     
-    def embed_text(self, text: str) -> List[float]:
+    def _run_async(self, coro):
+        """
+        Run a coroutine on the generator's background event loop and wait for it
+        
+        A single long-lived loop keeps the async clients' connection pools
+        alive across calls, from any thread (including FastAPI executors).
+        """
+        with self._loop_lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                threading.Thread(
+                    target=self._loop.run_forever,
+                    name="embedding-io",
+                    daemon=True
+                ).start()
+        return asyncio.run_coroutine_threadsafe(coro, self._loop).result()
+    
+    def _init_cache(self):
+        """Open the persistent embedding cache (disabled if diskcache is missing)"""
+        self._cache = None
+        cache_dir = os.getenv('EMBEDDING_CACHE_DIR', './.cache/embeddings')
+        if not cache_dir:
+            return
+        
+        try:
+            import diskcache
+            self._cache = diskcache.Index(cache_dir)
+        except ImportError:
+            print("⚠️  diskcache not installed; embedding cache disabled")
+            return
+        
+        # Keys are namespaced by model, so switching models never reuses stale vectors
+        self._cache_namespace = f"{self.provider}:{self.model_name}:{self.backend}"
+    
+    def _cache_key(self, text: str) -> str:
+        """Content-addressed cache key for a text under the current model"""
+        digest = hashlib.blake2b(text.encode('utf-8'), digest_size=16).hexdigest()
+        return f"{self._cache_namespace}:{digest}"
+    
+    def embed_text(self, text: str) -> np.ndarray:
         """
         Generate embedding for a single text
         
@@ -68,82 +262,146 @@ class EmbeddingGenerator:
             text: Text to embed
             
         Returns:
-            List of floats representing the embedding vector
+            float32 array of shape (dimension,)
         """
         if self.provider == 'sentence-transformers':
-            embedding = self.model.encode(text, convert_to_numpy=True)
-            return embedding.tolist()
+            embedding = self.model.encode(
+                text,
+                convert_to_numpy=True,
+                normalize_embeddings=True
+            )
+            return embedding.astype(np.float32, copy=False)
         
         elif self.provider == 'openai':
-            response = self.client.embeddings.create(
+            response = self._run_async(self.client.embeddings.create(
                 input=text,
                 model=self.model_name
-            )
-            return response.data[0].embedding
+            ))
+            return np.asarray(response.data[0].embedding, dtype=np.float32)
         
         elif self.provider == 'gemini':
-            result = self.genai_client.models.embed_content(
+            result = self._run_async(self.genai_client.aio.models.embed_content(
                 model=self.model_name,
-                content=text
-            )
-            return result.embeddings[0].values
+                contents=text
+            ))
+            return np.asarray(result.embeddings[0].values, dtype=np.float32)
     
-    def embed_batch(self, texts: List[str], batch_size: int = 32) -> List[List[float]]:
+    def embed_batch(self, texts: List[str], batch_size: int = 32) -> np.ndarray:
         """
         Generate embeddings for multiple texts efficiently
         
+        Previously embedded texts are served from the on-disk cache; only
+        cache misses reach the model.
+        
         Args:
             texts: List of texts to embed
             batch_size: Batch size for processing
             
         Returns:
-            List of embedding vectors
+            float32 array of shape (len(texts), dimension)
         """
         if not texts:
-            return []
+            return np.empty((0, self.dimension), dtype=np.float32)
+        
+        if self._cache is None:
+            return self._embed_uncached(texts, batch_size)
+        
+        keys = [self._cache_key(text) for text in texts]
+        embeddings = np.empty((len(texts), self.dimension), dtype=np.float32)
+        misses = []
+        for i, key in enumerate(keys):
+            cached = self._cache.get(key)
+            if cached is None:
+                misses.append(i)
+            else:
+                embeddings[i] = np.frombuffer(cached, dtype=np.float32)
         
+        if misses:
+            print(f"Embedding cache: {len(texts) - len(misses)} hits, {len(misses)} misses")
+            computed = self._embed_uncached([texts[i] for i in misses], batch_size)
+            embeddings[misses] = computed
+            with self._cache.transact():
+                for i, vector in zip(misses, computed):
+                    self._cache[keys[i]] = vector.tobytes()
+        
+        return embeddings
+    
+    def _embed_uncached(self, texts: List[str], batch_size: int) -> np.ndarray:
+        """Embed texts with the configured provider, bypassing the cache"""
         if self.provider == 'sentence-transformers':
-            # Sentence Transformers handles batching internally
+            # Sentence Transformers handles batching internally.
+            # Normalized output lets cosine similarity reduce to a dot product.
             embeddings = self.model.encode(
                 texts,
                 batch_size=batch_size,
                 show_progress_bar=True,
-                convert_to_numpy=True
+                convert_to_numpy=True,
+                normalize_embeddings=True
             )
-            return embeddings.tolist()
+            return embeddings.astype(np.float32, copy=False)
         
-        elif self.provider == 'openai':
-            # OpenAI API batch processing
-            embeddings = []
-            for i in range(0, len(texts), batch_size):
-                batch = texts[i:i+batch_size]
-                response = self.client.embeddings.create(
-                    input=batch,
-                    model=self.model_name
-                )
-                batch_embeddings = [item.embedding for item in response.data]
-                embeddings.extend(batch_embeddings)
-            return embeddings
+        batches = [texts[i:i+batch_size] for i in range(0, len(texts), batch_size)]
+        
+        if self.provider == 'openai':
+            # OpenAI API batch processing: all batches in flight at once
+            embeddings = self._run_async(self._openai_embed_batches(batches))
+            return np.asarray(embeddings, dtype=np.float32)
         
         elif self.provider == 'gemini':
-            # Gemini API batch processing
-            from tqdm import tqdm
-            embeddings = []
-            for i in tqdm(range(0, len(texts), batch_size), desc="Embedding"):
-                batch = texts[i:i+batch_size]
-                for text in batch:
-                    result = self.genai_client.models.embed_content(
+            # Gemini API batch processing: one request per batch, concurrently
+            embeddings = self._run_async(self._gemini_embed_batches(batches))
+            return np.asarray(embeddings, dtype=np.float32)
+    
+    async def _openai_embed_batches(self, batches: List[List[str]]) -> List[List[float]]:
+        """Embed batches with concurrent OpenAI requests over the pooled client"""
+        responses = await asyncio.gather(*(
+            self.client.embeddings.create(input=batch, model=self.model_name)
+            for batch in batches
+        ))
+        return [item.embedding for response in responses for item in response.data]
+    
+    async def _gemini_embed_batches(self, batches: List[List[str]], concurrency: int = 16) -> List[List[float]]:
+        """Embed batches with concurrent Gemini requests, falling back to per-text calls"""
+        semaphore = asyncio.Semaphore(concurrency)
+        
+        async def embed_batch(batch: List[str]) -> List[List[float]]:
+            try:
+                async with semaphore:
+                    result = await self.genai_client.aio.models.embed_content(
                         model=self.model_name,
-                        content=text
+                        contents=batch
                     )
-                    embeddings.append(result.embeddings[0].values)
-            return embeddings
+                return [e.values for e in result.embeddings]
+            except Exception as e:
+                print(f"Batch embedding failed ({e}), embedding texts concurrently")
+                return await self._gemini_embed_concurrent(batch)
+        
+        results = await asyncio.gather(*(embed_batch(batch) for batch in batches))
+        return [values for batch_values in results for values in batch_values]
+    
+    async def _gemini_embed_concurrent(self, texts: List[str], concurrency: int = 16) -> List[List[float]]:
+        """Embed texts with one Gemini request each, up to `concurrency` in flight"""
+        semaphore = asyncio.Semaphore(concurrency)
+        
+        async def embed_one(text: str) -> List[float]:
+            async with semaphore:
+                result = await self.genai_client.aio.models.embed_content(
+                    model=self.model_name,
+                    contents=text
+                )
+                return result.embeddings[0].values
+        
+        return await asyncio.gather(*(embed_one(text) for text in texts))
     
     def get_dimension(self) -> int:
         """Get the dimension of embeddings produced by this generator"""
         return self.dimension
     
-    def cosine_similarity(self, vec1: List[float], vec2: List[float]) -> float:
+    def cosine_similarity(
+        self,
+        vec1: Union[np.ndarray, List[float]],
+        vec2: Union[np.ndarray, List[float]]
+    ) -> float:
         """
         Calculate cosine similarity between two vectors
         
@@ -154,8 +412,11 @@ class EmbeddingGenerator:
         Returns:
             Similarity score between -1 and 1
         """
-        v1 = np.array(vec1)
-        v2 = np.array(vec2)
+        v1 = np.ascontiguousarray(vec1, dtype=np.float32)
+        v2 = np.ascontiguousarray(vec2, dtype=np.float32)
+        
+        if _cosine is not None:
+            return float(_cosine(v1, v2))
         
         dot_product = np.dot(v1, v2)
         norm1 = np.linalg.norm(v1)
@@ -165,6 +426,29 @@ class EmbeddingGenerator:
             return 0.0
         
         return float(dot_product / (norm1 * norm2))
+    
+    def cosine_similarity_batch(
+        self,
+        query: Union[np.ndarray, List[float]],
+        matrix: Union[np.ndarray, List[List[float]]]
+    ) -> np.ndarray:
+        """
+        Calculate cosine similarity between one vector and many
+        
+        Args:
+            query: Query vector of shape (dimension,)
+            matrix: Vectors of shape (N, dimension)
+            
+        Returns:
+            float32 array of N similarity scores
+        """
+        q = np.asarray(query, dtype=np.float32)
+        m = np.asarray(matrix, dtype=np.float32)
+        
+        # Single BLAS matrix-vector product; zero-norm rows score 0
+        scores = m @ q
+        norms = np.linalg.norm(m, axis=1) * np.linalg.norm(q)
+        return np.divide(scores, norms, out=np.zeros_like(scores), where=norms > 0)
 
 
 # Example usage
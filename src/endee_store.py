@@ -3,12 +3,21 @@ Endee Vector Store Module
 Client for interacting with Endee vector database
 """
 
+import asyncio
 import os
 import json
+import pickle
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import orjson
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from typing import List, Dict, Optional
 import numpy as np
 
+from kernels import cosine_batch
+
 
 class EndeeClient:
     """
@@ -19,39 +28,306 @@ class EndeeClient:
     common vector databases. You may need to adjust based on actual Endee API.
     """
     
-    def __init__(self, host: str = None, port: int = None):
+    # Searches are read-only, so failed connects and gateway errors are retried
+    # with exponential backoff; timeouts fall back to local search at once,
+    # and inserts are never re-sent after reaching the server
+    SEARCH_RETRIES = 3
+    RETRY_BACKOFF = 0.2
+    RETRY_STATUSES = (502, 503, 504)
+    
+    def __init__(
+        self,
+        host: str = None,
+        port: int = None,
+        quantization: str = None,
+        index: str = None,
+        store_dir: str = None
+    ):
         """
         Initialize Endee client
         
         Args:
             host: Endee server host
             port: Endee server port
+            quantization: 'int8' to add an int8 copy of the fallback store for
+                fast candidate search (requires simsimd), or None
+            index: Fallback search index, 'flat' (exact) or 'hnsw'
+                (approximate, requires hnswlib)
+            store_dir: Directory to persist the fallback store in, so it is
+                memory-mapped back on the next start instead of re-ingested
         """
         self.host = host or os.getenv('ENDEE_HOST', 'localhost')
         self.port = port or int(os.getenv('ENDEE_PORT', '8000'))
         self.base_url = f"http://{self.host}:{self.port}"
         
+        # Persistent sessions so requests reuse pooled keep-alive connections.
+        # Both retry failed connects and gateway errors (honoring Retry-After)
+        # and return the last response once retries run out; only the search
+        # session also retries POSTs, which may already have been applied,
+        # but never after a read timeout.
+        self.session = self._make_session(Retry.DEFAULT_ALLOWED_METHODS)
+        self.search_session = self._make_session(frozenset({'POST'}), read_retries=0)
+        
+        # httpx.AsyncClient for async_search, created on first use in each event loop
+        self._async_client = None
+        self._async_client_loop = None
+        
+        # Inserts are sent as concurrent mini-batches
+        self.insert_batch_size = int(os.getenv('ENDEE_INSERT_BATCH_SIZE', 256))
+        self.insert_workers = int(os.getenv('ENDEE_INSERT_WORKERS', 8))
+        
+        # SIMD cosine kernels for fallback search, if installed
+        try:
+            import simsimd
+            self._simd = simsimd
+        except ImportError:
+            self._simd = None
+        
+        self.quantization = quantization or os.getenv('FALLBACK_QUANTIZATION') or None
+        if self.quantization == 'int8' and self._simd is None:
+            print("⚠️  int8 fallback quantization needs simsimd; using float32 search")
+            self.quantization = None
+        
+        self.index_type = index or os.getenv('FALLBACK_INDEX', 'flat')
+        if self.index_type == 'hnsw':
+            try:
+                import hnswlib
+                self._hnswlib = hnswlib
+            except ImportError:
+                print("⚠️  hnswlib not installed; using exact fallback search")
+                self.index_type = 'flat'
+        
         # In-memory fallback if Endee is not available
         self.use_fallback = False
-        self.fallback_store = {
-            'vectors': [],
-            'metadata': []
-        }
+        self.store_dir = store_dir or os.getenv('FALLBACK_STORE_DIR') or None
+        # Guards the HNSW graph, which searches read while ingestion adds rows
+        self._hnsw_lock = threading.Lock()
+        self._reset_fallback_store()
+        if self.store_dir:
+            self._load_fallback_store()
         
         # Check connection
         self._check_connection()
     
+    def _make_session(self, retry_methods, read_retries: int = None) -> requests.Session:
+        """Create a pooled session retrying the given HTTP methods"""
+        retry = Retry(
+            total=self.SEARCH_RETRIES,
+            read=read_retries,
+            backoff_factor=self.RETRY_BACKOFF,
+            status_forcelist=self.RETRY_STATUSES,
+            allowed_methods=retry_methods,
+            raise_on_status=False
+        )
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=16, pool_maxsize=64, max_retries=retry)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        return session
+    
+    def _reset_fallback_store(self):
+        """Empty the in-memory fallback store"""
+        # Row-major float32 matrix of unit-length vectors, grown geometrically;
+        # only the first _count rows are valid
+        self._matrix = np.empty((0, 0), dtype=np.float32)
+        self._count = 0
+        self._metadata = []
+        # (paper_name, chunk_index) -> row, so re-ingested chunks replace
+        # their earlier rows instead of piling up as duplicates
+        self._row_index = {}
+        
+        # Optional int8 copy of _matrix (same rows) for candidate search
+        self._int8_matrix = None
+        if self.quantization == 'int8':
+            self._int8_matrix = np.empty((0, 0), dtype=np.int8)
+        
+        # HNSW graph over the same rows (labels are row indices), built lazily
+        self._hnsw = None
+    
+    def _store_paths(self):
+        """Paths of the persisted fallback vectors and metadata"""
+        return (
+            os.path.join(self.store_dir, 'store.f32'),
+            os.path.join(self.store_dir, 'meta.pkl')
+        )
+    
+    def _load_fallback_store(self):
+        """Memory-map the fallback store persisted by an earlier run, if any"""
+        vectors_path, meta_path = self._store_paths()
+        if not (os.path.exists(vectors_path) and os.path.exists(meta_path)):
+            return
+        
+        with open(meta_path, 'rb') as f:
+            state = pickle.load(f)
+        if not state['count']:
+            return
+        
+        # The file holds capacity rows; only the first count are valid
+        dimension = state['dimension']
+        capacity = os.path.getsize(vectors_path) // (4 * dimension)
+        self._matrix = np.memmap(
+            vectors_path, dtype=np.float32, mode='r+', shape=(capacity, dimension)
+        )
+        self._count = state['count']
+        self._metadata = state['metadata']
+        for row, metadata in enumerate(self._metadata):
+            key = self._row_key(metadata)
+            if key is not None:
+                self._row_index[key] = row
+        
+        if self._int8_matrix is not None:
+            self._int8_matrix = np.empty((capacity, dimension), dtype=np.int8)
+            self._int8_matrix[:self._count] = self._quantize_int8(self._matrix[:self._count])
+        
+        print(f"✓ Loaded {self._count} vectors from {self.store_dir}")
+    
+    def _resize_store_file(self, capacity: int, dimension: int) -> np.memmap:
+        """Grow the persisted vector file to capacity rows and map it again"""
+        vectors_path, _ = self._store_paths()
+        os.makedirs(self.store_dir, exist_ok=True)
+        if isinstance(self._matrix, np.memmap):
+            self._matrix.flush()
+        
+        # Existing rows stay in place; the file is only extended
+        with open(vectors_path, 'ab') as f:
+            f.truncate(capacity * dimension * 4)
+        return np.memmap(
+            vectors_path, dtype=np.float32, mode='r+', shape=(capacity, dimension)
+        )
+    
+    def _persist_fallback_store(self):
+        """Flush vectors to disk, then atomically replace the metadata file"""
+        vectors_path, meta_path = self._store_paths()
+        self._matrix.flush()
+        
+        state = {
+            'dimension': self._matrix.shape[1],
+            'count': self._count,
+            'metadata': self._metadata
+        }
+        tmp_path = meta_path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, meta_path)
+    
+    def _build_hnsw(self):
+        """Build the HNSW index from the rows stored so far"""
+        self._hnsw = self._hnswlib.Index(space='cosine', dim=self._matrix.shape[1])
+        self._hnsw.init_index(
+            max_elements=max(len(self._matrix), 1024),
+            ef_construction=200,
+            M=16
+        )
+        self._hnsw.add_items(self._matrix[:self._count], np.arange(self._count))
+    
+    @staticmethod
+    def _quantize_int8(block: np.ndarray) -> np.ndarray:
+        """
+        Quantize rows to int8 with a per-row scale of max(|v|) / 127
+        
+        Scales are not kept: cosine similarity is invariant to them.
+        """
+        scales = np.abs(block).max(axis=1, keepdims=True) / 127.0
+        scales[scales == 0] = 1.0
+        return np.round(block / scales).astype(np.int8)
+    
+    @staticmethod
+    def _row_key(metadata: Dict):
+        """Identity of a stored chunk, or None if it has none"""
+        if 'paper_name' in metadata and 'chunk_index' in metadata:
+            return metadata['paper_name'], metadata['chunk_index']
+        return None
+    
+    def _fallback_insert(self, vectors, metadatas: List[Dict], persist: bool = True):
+        """
+        Add vectors and metadata to the fallback store
+        
+        Chunks already stored (same paper_name and chunk_index) are replaced
+        in place; everything else is appended.
+        
+        Args:
+            vectors: Embedding vectors
+            metadatas: Metadata dicts (same length as vectors)
+            persist: Write the store to store_dir afterwards (if set)
+        """
+        block = np.array(vectors, dtype=np.float32)
+        if len(block) == 0:
+            return
+        
+        # Normalize once so search is a plain dot product
+        block /= np.linalg.norm(block, axis=1, keepdims=True) + 1e-12
+        
+        # Target row of each input; for repeated keys the last input wins
+        targets = {}
+        added = 0
+        for i, metadata in enumerate(metadatas):
+            key = self._row_key(metadata)
+            row = self._row_index.get(key) if key is not None else None
+            if row is None:
+                row = self._count + added
+                added += 1
+                if key is not None:
+                    self._row_index[key] = row
+            targets[row] = i
+        rows = np.fromiter(targets.keys(), dtype=np.int64, count=len(targets))
+        sources = np.fromiter(targets.values(), dtype=np.int64, count=len(targets))
+        if len(sources) != len(block):
+            block = block[sources]
+        
+        needed = self._count + added
+        if needed > len(self._matrix) or block.shape[1] != self._matrix.shape[1]:
+            capacity = max(needed, 2 * len(self._matrix), 1024)
+            if self.store_dir:
+                self._matrix = self._resize_store_file(capacity, block.shape[1])
+            else:
+                matrix = np.empty((capacity, block.shape[1]), dtype=np.float32)
+                if self._count:
+                    matrix[:self._count] = self._matrix[:self._count]
+                self._matrix = matrix
+            
+            if self._int8_matrix is not None:
+                int8_matrix = np.empty((capacity, block.shape[1]), dtype=np.int8)
+                if self._count:
+                    int8_matrix[:self._count] = self._int8_matrix[:self._count]
+                self._int8_matrix = int8_matrix
+        
+        self._matrix[rows] = block
+        if self._int8_matrix is not None:
+            self._int8_matrix[rows] = self._quantize_int8(block)
+        
+        # Publish metadata and the row count before the rows become reachable
+        # through the graph, so every label a search returns has metadata
+        self._metadata.extend([None] * added)
+        for row, i in zip(rows.tolist(), sources.tolist()):
+            self._metadata[row] = metadatas[i]
+        self._count = needed
+        
+        with self._hnsw_lock:
+            # A graph built after _count was published already has these rows;
+            # adding them again just updates the same labels
+            if self._hnsw is not None:
+                if needed > self._hnsw.get_max_elements():
+                    self._hnsw.resize_index(len(self._matrix))
+                # Existing labels are updated in place
+                self._hnsw.add_items(block, rows)
+        
+        if persist and self.store_dir:
+            self._persist_fallback_store()
+    
     def _check_connection(self):
         """Check if Endee server is accessible"""
         try:
-            # Try to ping the server
+            # Try to ping the server (once, bypassing the session's retries)
             response = requests.get(f"{self.base_url}/health", timeout=2)
             if response.status_code == 200:
                 print(f"✓ Connected to Endee at {self.base_url}")
                 self.use_fallback = False
         except requests.exceptions.RequestException:
             print(f"⚠️  Warning: Cannot connect to Endee at {self.base_url}")
-            print("   Using in-memory fallback store (data will not persist)")
+            if self.store_dir:
+                print(f"   Using fallback store persisted in {self.store_dir}")
+            else:
+                print("   Using in-memory fallback store (data will not persist)")
             print("   To use Endee, run: docker-compose up -d")
             self.use_fallback = True
     
@@ -71,7 +347,7 @@ class EndeeClient:
             return True
         
         try:
-            response = requests.post(
+            response = self.session.post(
                 f"{self.base_url}/collections",
                 json={
                     'name': name,
@@ -106,32 +382,56 @@ class EndeeClient:
             raise ValueError("Vectors and metadatas must have same length")
         
         if self.use_fallback:
-            # In-memory storage
-            self.fallback_store['vectors'].extend(vectors)
-            self.fallback_store['metadata'].extend(metadatas)
+            # In-memory storage, copied in mini-batches so a memory-mapped
+            # input is never loaded whole
+            for start in range(0, len(vectors), self.insert_batch_size):
+                end = start + self.insert_batch_size
+                self._fallback_insert(vectors[start:end], metadatas[start:end], persist=False)
+            if self.store_dir and len(vectors):
+                self._persist_fallback_store()
             return True
         
-        try:
-            # Prepare data
-            data = {
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        starts = range(0, len(vectors), self.insert_batch_size)
+        
+        def post_batch(start: int):
+            end = start + self.insert_batch_size
+            # orjson writes float32 arrays straight from the buffer, no Python floats
+            payload = orjson.dumps({
                 'collection': collection,
-                'vectors': vectors,
-                'metadata': metadatas
-            }
-            
-            response = requests.post(
-                f"{self.base_url}/vectors/insert",
-                json=data,
-                timeout=30
-            )
-            
-            return response.status_code in [200, 201]
-        except Exception as e:
-            print(f"Error inserting vectors: {e}")
-            # Fallback to in-memory
-            self.fallback_store['vectors'].extend(vectors)
-            self.fallback_store['metadata'].extend(metadatas)
-            return True
+                'vectors': vectors[start:end],
+                'metadata': metadatas[start:end]
+            }, option=orjson.OPT_SERIALIZE_NUMPY)
+            try:
+                response = self.session.post(
+                    f"{self.base_url}/vectors/insert",
+                    data=payload,
+                    headers={'Content-Type': 'application/json'},
+                    timeout=30
+                )
+                return response.status_code in [200, 201]
+            except Exception as e:
+                return e
+        
+        with ThreadPoolExecutor(max_workers=self.insert_workers) as executor:
+            outcomes = list(executor.map(post_batch, starts))
+        
+        success = True
+        fell_back = False
+        for start, outcome in zip(starts, outcomes):
+            if isinstance(outcome, Exception):
+                print(f"Error inserting vectors: {outcome}")
+                # Fallback to in-memory (persisted once, below)
+                end = start + self.insert_batch_size
+                self._fallback_insert(vectors[start:end], metadatas[start:end], persist=False)
+                fell_back = True
+            elif not outcome:
+                success = False
+        
+        if fell_back and self.store_dir:
+            self._persist_fallback_store()
+        
+        return success
     
     def search(
         self,
@@ -162,26 +462,121 @@ class EndeeClient:
             return self._fallback_search(query_vector, top_k, threshold)
         
         try:
-            response = requests.post(
+            response = self.search_session.post(
                 f"{self.base_url}/vectors/search",
-                json={
-                    'collection': collection,
-                    'query': query_vector,
-                    'top_k': top_k,
-                    'threshold': threshold
-                },
+                data=self._search_payload(query_vector, top_k, collection, threshold),
+                headers={'Content-Type': 'application/json'},
                 timeout=10
             )
             
             if response.status_code == 200:
-                return response.json().get('results', [])
+                return orjson.loads(response.content).get('results', [])
             else:
                 # Fallback
                 return self._fallback_search(query_vector, top_k, threshold)
-        except Exception as e:
+        except (requests.Timeout, requests.ConnectionError) as e:
+            # Endee unreachable; other errors are bugs and propagate
             print(f"Error searching: {e}, using fallback")
             return self._fallback_search(query_vector, top_k, threshold)
     
+    async def async_search(
+        self,
+        query_vector: List[float],
+        top_k: int = 5,
+        collection: str = 'research_papers',
+        threshold: float = 0.0
+    ) -> List[Dict]:
+        """
+        Search for similar vectors without blocking the event loop
+        
+        Same arguments and results as search(). Requests go through a pooled
+        httpx.AsyncClient, so concurrent queries share connections; without
+        httpx, search() runs in a worker thread instead. Local fallback
+        searches also run in a worker thread.
+        """
+        if self.use_fallback:
+            return await asyncio.to_thread(
+                self._fallback_search, query_vector, top_k, threshold
+            )
+        
+        client = self._get_async_client()
+        if client is None:
+            return await asyncio.to_thread(
+                self.search, query_vector, top_k, collection, threshold
+            )
+        
+        import httpx
+        payload = self._search_payload(query_vector, top_k, collection, threshold)
+        
+        # Same retry policy as search_session
+        for attempt in range(self.SEARCH_RETRIES + 1):
+            last_attempt = attempt == self.SEARCH_RETRIES
+            try:
+                response = await client.post(
+                    f"{self.base_url}/vectors/search",
+                    content=payload,
+                    headers={'Content-Type': 'application/json'},
+                    timeout=10
+                )
+            except (httpx.TimeoutException, httpx.NetworkError) as e:
+                # Only failed connects are retried; a slow Endee falls back now
+                if last_attempt or not isinstance(e, httpx.ConnectError):
+                    print(f"Error searching: {e}, using fallback")
+                    return await asyncio.to_thread(
+                        self._fallback_search, query_vector, top_k, threshold
+                    )
+                await asyncio.sleep(self._retry_delay(attempt))
+                continue
+            
+            if response.status_code in self.RETRY_STATUSES and not last_attempt:
+                await asyncio.sleep(
+                    self._retry_delay(attempt, response.headers.get('Retry-After'))
+                )
+                continue
+            
+            if response.status_code == 200:
+                return orjson.loads(response.content).get('results', [])
+            else:
+                # Fallback
+                return await asyncio.to_thread(
+                    self._fallback_search, query_vector, top_k, threshold
+                )
+    
+    def _retry_delay(self, attempt: int, retry_after: Optional[str] = None) -> float:
+        """Seconds to wait before retry number attempt + 1"""
+        if retry_after and retry_after.isdigit():
+            return float(retry_after)
+        return self.RETRY_BACKOFF * (2 ** attempt)
+    
+    def _get_async_client(self):
+        """Return an httpx.AsyncClient bound to the running loop, or None without httpx"""
+        loop = asyncio.get_running_loop()
+        if self._async_client is None or self._async_client_loop is not loop:
+            try:
+                import httpx
+            except ImportError:
+                return None
+            self._async_client = httpx.AsyncClient(
+                limits=httpx.Limits(max_keepalive_connections=16, max_connections=64)
+            )
+            self._async_client_loop = loop
+        return self._async_client
+    
+    def _search_payload(
+        self,
+        query_vector: List[float],
+        top_k: int,
+        collection: str,
+        threshold: float
+    ) -> bytes:
+        """Serialize a search request body"""
+        return orjson.dumps({
+            'collection': collection,
+            'query': np.ascontiguousarray(query_vector, dtype=np.float32),
+            'top_k': top_k,
+            'threshold': threshold
+        }, option=orjson.OPT_SERIALIZE_NUMPY)
+    
     def _fallback_search(
         self,
         query_vector: List[float],
@@ -189,48 +584,97 @@ class EndeeClient:
         threshold: float
     ) -> List[Dict]:
         """In-memory similarity search using cosine similarity"""
-        if not self.fallback_store['vectors']:
+        if not self._count or top_k <= 0:
             return []
         
-        query_vec = np.array(query_vector)
-        stored_vectors = np.array(self.fallback_store['vectors'])
-        
-        # Compute cosine similarities
-        similarities = []
-        for i, vec in enumerate(stored_vectors):
-            sim = self._cosine_similarity(query_vec, vec)
-            if sim >= threshold:
-                similarities.append({
-                    'index': i,
-                    'similarity': float(sim),
-                    'metadata': self.fallback_store['metadata'][i]
-                })
-        
-        # Sort by similarity (descending)
-        similarities.sort(key=lambda x: x['similarity'], reverse=True)
-        
-        # Return top-k
-        return similarities[:top_k]
-    
-    def _cosine_similarity(self, vec1: np.ndarray, vec2: np.ndarray) -> float:
-        """Calculate cosine similarity between two vectors"""
-        dot_product = np.dot(vec1, vec2)
-        norm1 = np.linalg.norm(vec1)
-        norm2 = np.linalg.norm(vec2)
+        # Stored rows are unit length, so cosine similarity is a single
+        # matrix-vector product with the normalized query
+        query_vec = np.array(query_vector, dtype=np.float32)
+        query_vec /= np.linalg.norm(query_vec) + 1e-12
+        if self.index_type == 'hnsw':
+            return self._hnsw_search(query_vec, top_k, threshold)
+        
+        matrix = self._matrix[:self._count]
+        candidates = None
+        
+        if self._int8_matrix is not None:
+            # Coarse int8 pass over every row, then exact float32 rescoring
+            # of the best 4 * top_k candidates
+            distances = self._simd.cdist(
+                self._quantize_int8(query_vec[None, :]),
+                self._int8_matrix[:self._count],
+                metric='cosine'
+            )
+            approx = 1.0 - np.asarray(distances).ravel()
+            n = min(4 * top_k, self._count)
+            candidates = np.argpartition(-approx, n - 1)[:n]
+            sims = matrix[candidates] @ query_vec
+        elif self._simd is not None:
+            distances = self._simd.cdist(query_vec[None, :], matrix, metric='cosine')
+            sims = 1.0 - np.asarray(distances).ravel()
+        elif cosine_batch is not None:
+            # Parallel Numba kernel, no temporaries
+            sims = cosine_batch(matrix, query_vec)
+        else:
+            sims = matrix @ query_vec
         
-        if norm1 == 0 or norm2 == 0:
-            return 0.0
+        # Top-k by partial selection, then sort only the selected entries
+        k = min(top_k, len(sims))
+        top = np.argpartition(-sims, k - 1)[:k]
+        top = top[np.argsort(-sims[top])]
+        indices = top if candidates is None else candidates[top]
         
-        return dot_product / (norm1 * norm2)
+        return [
+            {
+                'index': int(i),
+                'similarity': float(sim),
+                'metadata': self._metadata[i]
+            }
+            for i, sim in zip(indices, sims[top])
+            if sim >= threshold
+        ]
+    
+    def _hnsw_search(
+        self,
+        query_vec: np.ndarray,
+        top_k: int,
+        threshold: float
+    ) -> List[Dict]:
+        """Approximate fallback search through the HNSW index"""
+        with self._hnsw_lock:
+            if self._hnsw is None:
+                self._build_hnsw()
+            
+            # The graph may trail _count while an insert waits for the lock
+            k = min(top_k, self._hnsw.get_current_count())
+            if k == 0:
+                return []
+            self._hnsw.set_ef(max(50, k))
+            labels, distances = self._hnsw.knn_query(query_vec, k=k)
+        
+        # Results come back nearest first; cosine distance is 1 - similarity
+        return [
+            {
+                'index': int(i),
+                'similarity': float(1.0 - distance),
+                'metadata': self._metadata[i]
+            }
+            for i, distance in zip(labels[0], distances[0])
+            if 1.0 - distance >= threshold
+        ]
     
     def delete_collection(self, collection: str = 'research_papers') -> bool:
         """Delete a collection"""
         if self.use_fallback:
-            self.fallback_store = {'vectors': [], 'metadata': []}
+            self._reset_fallback_store()
+            if self.store_dir:
+                for path in self._store_paths():
+                    if os.path.exists(path):
+                        os.remove(path)
             return True
         
         try:
-            response = requests.delete(
+            response = self.session.delete(
                 f"{self.base_url}/collections/{collection}",
                 timeout=5
             )
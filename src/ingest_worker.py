@@ -0,0 +1,37 @@
+"""
+Ingest Worker Module
+PDF parsing and chunking run in ingestion worker processes
+"""
+
+from typing import Dict
+
+from pdf_loader import PDFLoader
+from chunker import Chunker
+
+
+def parse_and_chunk(pdf_path: str, pdf_loader: PDFLoader, chunker: Chunker) -> Dict:
+    """
+    Extract and chunk a single PDF
+    
+    Lives in its own module so worker processes only import the PDF loader
+    and chunker, never the embedding model or vector store.
+    
+    Args:
+        pdf_path: Path to PDF file
+        pdf_loader: Loader used to extract sections
+        chunker: Chunker used to split sections
+        
+    Returns:
+        Dictionary with 'sections' (count) and 'chunks'
+    """
+    document = pdf_loader.extract_text_with_structure(pdf_path)
+    return {
+        'sections': len(document['sections']),
+        'chunks': chunker.chunk_document(document)
+    }
+
+
+# Example usage
+if __name__ == "__main__":
+    result = parse_and_chunk("sample_paper.pdf", PDFLoader(), Chunker())
+    print(f"Sections: {result['sections']}, chunks: {len(result['chunks'])}")
@@ -0,0 +1,62 @@
+"""
+Kernels Module
+Numba-compiled similarity kernels for the in-memory vector store
+"""
+
+import threading
+import numpy as np
+
+try:
+    from numba import njit, prange
+except ImportError:
+    njit = None
+    prange = range
+
+
+def _cosine_batch(matrix: np.ndarray, query: np.ndarray) -> np.ndarray:
+    """
+    Cosine similarity between every row of a matrix and a query vector
+
+    Rows and query must already be unit length, so this is a dot product.
+
+    Args:
+        matrix: C-contiguous float32 array of shape (N, D) with unit-length rows
+        query: C-contiguous float32 unit-length array of shape (D,)
+
+    Returns:
+        float32 array of N similarity scores
+    """
+    out = np.empty(matrix.shape[0], dtype=np.float32)
+    for i in prange(matrix.shape[0]):
+        dot = 0.0
+        for k in range(query.size):
+            dot += matrix[i, k] * query[k]
+        out[i] = dot
+    return out
+
+
+# Compiled (and cached on disk) on first call; the default workqueue threading
+# layer is not thread-safe, so concurrent searches take turns on the kernel
+if njit is not None:
+    _cosine_batch_parallel = njit(fastmath=True, parallel=True, cache=True)(_cosine_batch)
+    _kernel_lock = threading.Lock()
+
+    def cosine_batch(matrix: np.ndarray, query: np.ndarray) -> np.ndarray:
+        with _kernel_lock:
+            return _cosine_batch_parallel(matrix, query)
+else:
+    cosine_batch = None
+
+
+# Example usage
+if __name__ == "__main__":
+    if cosine_batch is None:
+        print("Numba not installed")
+    else:
+        rng = np.random.default_rng(0)
+        matrix = rng.standard_normal((1000, 384)).astype(np.float32)
+        matrix /= np.linalg.norm(matrix, axis=1, keepdims=True)
+        query = matrix[42].copy()
+
+        scores = cosine_batch(matrix, query)
+        print(f"Best match: {int(np.argmax(scores))} (score {scores.max():.3f})")
@@ -5,7 +5,7 @@ Extracts text from research papers while preserving document structure
 
 import re
 from pathlib import Path
-from typing import Dict, List
+from typing import Dict, Iterator, List, Tuple
 import fitz  # PyMuPDF
 
 
@@ -31,9 +31,41 @@ class PDFLoader:
         r'^bibliography\s*$',
         r'^\d+\.?\s+[A-Z][a-z]+',  # Numbered sections like "1. Introduction"
     ]
+    SECTION_REGEX = re.compile('|'.join(SECTION_PATTERNS), re.IGNORECASE)
+    NUMBERING_REGEX = re.compile(r'^\d+\.?\s*')
+    # Run over '\n' + page text, matches the newline before every line that
+    # could be a header: one starting with whitespace (headers are checked
+    # stripped), one matching SECTION_PATTERNS as-is, or one without lowercase
+    # ASCII (the all-caps heuristic). This is a superset of headers as long as
+    # end-anchored patterns allow trailing whitespace (asserted below);
+    # _is_section_header confirms each candidate.
+    HEADER_CANDIDATE_REGEX = re.compile(
+        r'\n(?=[^\S\n]|(?i:' + '|'.join(SECTION_PATTERNS) + r')|[^a-z\n]*$)',
+        re.MULTILINE
+    )
+    assert all(not p.endswith('$') or p.endswith(r'\s*$') for p in SECTION_PATTERNS), \
+        "End-anchored SECTION_PATTERNS must allow trailing whitespace (\\s*$)"
+    
+    TITLE_TEXT_FLAGS = fitz.TEXTFLAGS_DICT & ~fitz.TEXT_PRESERVE_IMAGES
+    
+    # Standard section names, checked in order against the lowercased header
+    SECTION_NAMES = [
+        (('abstract',), 'Abstract'),
+        (('intro',), 'Introduction'),
+        (('background',), 'Background'),
+        (('related',), 'Related Work'),
+        (('method', 'approach'), 'Methodology'),
+        (('experiment',), 'Experiments'),
+        (('result',), 'Results'),
+        (('evaluation',), 'Evaluation'),
+        (('discussion',), 'Discussion'),
+        (('conclusion',), 'Conclusion'),
+        (('future',), 'Future Work'),
+        (('reference', 'bibliography'), 'References'),
+    ]
     
     def __init__(self):
-        self.section_regex = re.compile('|'.join(self.SECTION_PATTERNS), re.IGNORECASE)
+        self.section_regex = self.SECTION_REGEX
     
     def extract_text_with_structure(self, pdf_path: str) -> Dict:
         """
@@ -74,20 +106,20 @@ class PDFLoader:
             'pages': len(doc)
         }
         
-        # Extract text with page numbers
-        page_texts = []
-        for page_num in range(len(doc)):
-            page = doc[page_num]
-            text = page.get_text()
-            page_texts.append({
-                'page_num': page_num + 1,
-                'text': text
-            })
-        
-        doc.close()
-        
-        # Detect sections
-        sections = self._detect_sections(page_texts)
+        try:
+            # Detect sections while pages are still being read
+            sections = self._detect_sections(self._stream_pages(doc))
+            
+            # If no sections detected, treat entire document as one section
+            if not sections:
+                sections = [{
+                    'section_name': 'Full Document',
+                    'text': '\n'.join(page.get_text() for page in doc),
+                    'page_start': 1,
+                    'page_end': len(doc)
+                }]
+        finally:
+            doc.close()
         
         return {
             'metadata': metadata,
@@ -101,85 +133,111 @@ class PDFLoader:
         """
         try:
             first_page = doc[0]
-            blocks = first_page.get_text("dict")["blocks"]
+            # Text blocks only: skips decoding embedded image data into the dict
+            blocks = first_page.get_text("dict", flags=self.TITLE_TEXT_FLAGS)["blocks"]
             
             # Find text with largest font size
             max_size = 0
             title = ""
             
             for block in blocks:
-                if "lines" in block:
-                    for line in block["lines"]:
-                        for span in line["spans"]:
-                            if span["size"] > max_size:
-                                max_size = span["size"]
-                                title = span["text"].strip()
+                for line in block["lines"]:
+                    for span in line["spans"]:
+                        if span["size"] > max_size:
+                            max_size = span["size"]
+                            title = span["text"]
+            
+            title = title.strip()
             
             return title if title else "Unknown Title"
         except:
             return "Unknown Title"
     
-    def _detect_sections(self, page_texts: List[Dict]) -> List[Dict]:
+    @staticmethod
+    def _stream_pages(doc) -> Iterator[Tuple[int, str]]:
+        """Yield (page_num, text) pairs one page at a time"""
+        for page_num, page in enumerate(doc, start=1):
+            yield page_num, page.get_text()
+    
+    def _detect_sections(self, pages: Iterator[Tuple[int, str]]) -> List[Dict]:
         """
         Detect sections in the document
         
+        Each page is scanned once for candidate header lines; the text between
+        headers is sliced out of the page rather than handled line by line.
+        
         Args:
-            page_texts: List of dicts with page_num and text
+            pages: Iterator of (page_num, text) pairs
             
         Returns:
-            List of sections with metadata
+            List of sections with metadata (empty if the document has no text)
         """
         sections = []
+        # Runs of body lines are buffered per section and joined once when it closes
         current_section = {
             'section_name': 'Introduction',
-            'text': '',
+            'parts': [],
             'page_start': 1,
             'page_end': 1
         }
         
-        for page_data in page_texts:
-            page_num = page_data['page_num']
-            text = page_data['text']
-            lines = text.split('\n')
+        for page_num, text in pages:
+            # Start of the first line not yet assigned to a section
+            start = 0
             
-            for line in lines:
-                line_stripped = line.strip()
+            # Offsets in '\n' + text: each match starts one before its line,
+            # which is exactly the line's offset in text
+            for match in self.HEADER_CANDIDATE_REGEX.finditer('\n' + text):
+                line_start = match.start()
+                line_end = text.find('\n', line_start)
+                if line_end == -1:
+                    line_end = len(text)
+                line_stripped = text[line_start:line_end].strip()
                 
-                # Check if line is a section header
-                if self._is_section_header(line_stripped):
-                    # Save current section if it has content
-                    if current_section['text'].strip():
-                        current_section['page_end'] = page_num
-                        sections.append(current_section)
-                    
-                    # Start new section
-                    current_section = {
-                        'section_name': self._normalize_section_name(line_stripped),
-                        'text': '',
-                        'page_start': page_num,
-                        'page_end': page_num
-                    }
-                else:
-                    # Add to current section
-                    current_section['text'] += line + '\n'
-                    current_section['page_end'] = page_num
+                if not self._is_section_header(line_stripped):
+                    continue
+                
+                # Lines before the header belong to the current section
+                if line_start > start:
+                    current_section['parts'].append(text[start:line_start - 1])
+                
+                # Save current section if it has content
+                current_section['page_end'] = page_num
+                self._close_section(current_section, sections)
+                
+                # Start new section
+                current_section = {
+                    'section_name': self._normalize_section_name(line_stripped),
+                    'parts': [],
+                    'page_start': page_num,
+                    'page_end': page_num
+                }
+                start = line_end + 1
+            
+            # Remaining lines of the page
+            if start <= len(text):
+                current_section['parts'].append(text[start:])
+                current_section['page_end'] = page_num
         
         # Add last section
-        if current_section['text'].strip():
-            sections.append(current_section)
-        
-        # If no sections detected, treat entire document as one section
-        if not sections:
-            all_text = '\n'.join([p['text'] for p in page_texts])
-            sections = [{
-                'section_name': 'Full Document',
-                'text': all_text,
-                'page_start': 1,
-                'page_end': len(page_texts)
-            }]
+        self._close_section(current_section, sections)
         
         return sections
     
+    @staticmethod
+    def _close_section(section: Dict, sections: List[Dict]):
+        """Join a section's buffered lines and keep it if it has any content"""
+        if not section['parts']:
+            return
+        text = '\n'.join(section['parts']) + '\n'
+        if text.strip():
+            sections.append({
+                'section_name': section['section_name'],
+                'text': text,
+                'page_start': section['page_start'],
+                'page_end': section['page_end']
+            })
+    
     def _is_section_header(self, line: str) -> bool:
         """Check if a line is likely a section header"""
         if not line or len(line) > 100:  # Headers are usually short
@@ -197,39 +255,17 @@ class PDFLoader:
     
     def _normalize_section_name(self, header: str) -> str:
         """Normalize section header to standard name"""
-        header_lower = header.lower().strip()
-        
         # Remove numbering
-        header_lower = re.sub(r'^\d+\.?\s*', '', header_lower)
+        header_lower = self.NUMBERING_REGEX.sub('', header.lower().strip())
         
         # Map to standard names
-        if 'abstract' in header_lower:
-            return 'Abstract'
-        elif 'introduction' in header_lower or 'intro' in header_lower:
-            return 'Introduction'
-        elif 'background' in header_lower:
-            return 'Background'
-        elif 'related' in header_lower:
-            return 'Related Work'
-        elif 'method' in header_lower or 'approach' in header_lower:
-            return 'Methodology'
-        elif 'experiment' in header_lower:
-            return 'Experiments'
-        elif 'result' in header_lower:
-            return 'Results'
-        elif 'evaluation' in header_lower:
-            return 'Evaluation'
-        elif 'discussion' in header_lower:
-            return 'Discussion'
-        elif 'conclusion' in header_lower:
-            return 'Conclusion'
-        elif 'future' in header_lower:
-            return 'Future Work'
-        elif 'reference' in header_lower or 'bibliography' in header_lower:
-            return 'References'
-        else:
-            # Capitalize first letter of each word
-            return header.title()
+        for keywords, name in self.SECTION_NAMES:
+            for keyword in keywords:
+                if keyword in header_lower:
+                    return name
+        
+        # Capitalize first letter of each word
+        return header.title()
 
 
 # Example usage
@@ -3,12 +3,22 @@ RAG Pipeline Module
 Orchestrates the complete RAG workflow
 """
 
+import asyncio
+import hashlib
+import multiprocessing
 import os
-from typing import List, Dict
+import tempfile
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from itertools import chain, islice
+from typing import List, Dict, Tuple
 from pathlib import Path
+import numpy as np
 
 from pdf_loader import PDFLoader
 from chunker import Chunker
+from ingest_worker import parse_and_chunk
 from embeddings import EmbeddingGenerator
 from endee_store import EndeeClient
 
@@ -34,6 +44,42 @@ class RAGPipeline:
         self.collection_name = 'research_papers'
         self.top_k = int(os.getenv('TOP_K', 5))
         self.similarity_threshold = float(os.getenv('SIMILARITY_THRESHOLD', 0.7))
+        self.embed_window = int(os.getenv('EMBED_WINDOW', 1024))
+        self.ingest_workers = int(os.getenv('INGEST_WORKERS', 0)) or os.cpu_count() or 1
+        self.embeddings_mmap_dir = os.getenv('EMBEDDINGS_MMAP_DIR', '')
+        
+        # The API ingests from executor threads; one ingestion runs at a time
+        self._ingest_lock = threading.Lock()
+        
+        # LRU of recent question embeddings, keyed by question text
+        self.question_cache_size = int(os.getenv('QUESTION_CACHE_SIZE', 128))
+        self._question_cache = OrderedDict()
+        self._question_cache_lock = threading.Lock()
+        
+        # Prompt text is built once; the system prompt is an unchanging prefix,
+        # which lets provider-side prompt caching reuse it across queries
+        self._system_prompt = """You are a helpful and knowledgeable research assistant. Your goal is to provide useful insights from research papers.
+
+GUIDELINES:
+1. ALWAYS try to provide a helpful answer based on the available context
+2. Synthesize information from the context to answer the question as best as you can
+3. Use bullet points or numbered lists for clarity
+4. Quote specific findings, methods, or contributions when they're explicitly mentioned
+5. If the context has partial or related information, use it! Don't refuse to answer
+6. Be conversational and friendly, not overly cautious
+7. Only say you cannot answer if there is truly ZERO relevant information in the context
+8. Base all answers strictly on the provided context - no external knowledge"""
+
+        self._user_template = """Question: {question}
+
+Context from research papers:
+{context}
+
+Based on the context above, please provide a helpful answer to the question. 
+Synthesize the information and present it clearly using bullet points or numbered lists when appropriate.
+Be specific and quote relevant findings when they're explicitly stated.
+
+Answer:"""
         
         # Initialize LLM
         self._initialize_llm()
@@ -52,8 +98,9 @@ class RAGPipeline:
         
         if llm_provider == 'openai':
             try:
-                from openai import OpenAI
+                from openai import AsyncOpenAI, OpenAI
                 self.llm_client = OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
+                self.async_llm_client = AsyncOpenAI(api_key=os.getenv('OPENAI_API_KEY'))
                 self.llm_model = os.getenv('LLM_MODEL', 'gpt-3.5-turbo')
                 self.llm_provider = 'openai'
                 print(f"✓ LLM configured: {self.llm_model}")
@@ -84,65 +131,103 @@ class RAGPipeline:
         """
         Ingest research papers into the system
         
+        Safe to call from several threads; concurrent calls run one at a time.
+        
         Args:
             pdf_paths: List of paths to PDF files
         """
+        with self._ingest_lock:
+            self._ingest_papers(pdf_paths)
+    
+    def _ingest_papers(self, pdf_paths: List[str]):
+        """Ingest papers; callers must hold _ingest_lock"""
         print(f"\n{'='*60}")
         print("📥 INGESTION PIPELINE")
         print(f"{'='*60}\n")
         
-        all_chunks = []
+        chunk_lists = []
         
-        for pdf_path in pdf_paths:
+        # 1-2. Extract and chunk each PDF; CPU-bound, so spread files across processes
+        workers = min(len(pdf_paths), self.ingest_workers)
+        if workers > 1:
+            # Never fork: this process may already run threads (API executors,
+            # the embedding event loop, BLAS/torch pools)
+            start_method = (
+                'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods()
+                else 'spawn'
+            )
+            with ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context(start_method)
+            ) as executor:
+                futures = [
+                    executor.submit(parse_and_chunk, pdf_path, self.pdf_loader, self.chunker)
+                    for pdf_path in pdf_paths
+                ]
+                outcomes = []
+                for future in futures:
+                    try:
+                        outcomes.append(future.result())
+                    except Exception as e:
+                        outcomes.append(e)
+        else:
+            outcomes = []
+            for pdf_path in pdf_paths:
+                try:
+                    outcomes.append(parse_and_chunk(pdf_path, self.pdf_loader, self.chunker))
+                except Exception as e:
+                    outcomes.append(e)
+        
+        for pdf_path, outcome in zip(pdf_paths, outcomes):
             print(f"Processing: {Path(pdf_path).name}")
             
-            try:
-                # 1. Extract text with structure
-                print("  └─ Extracting text...")
-                document = self.pdf_loader.extract_text_with_structure(pdf_path)
-                print(f"     ✓ Found {len(document['sections'])} sections")
-                
-                # 2. Chunk document
-                print("  └─ Chunking document...")
-                chunks = self.chunker.chunk_document(document)
-                print(f"     ✓ Created {len(chunks)} chunks")
-                
-                all_chunks.extend(chunks)
-                
-            except Exception as e:
-                print(f"  └─ ❌ Error: {e}")
+            if isinstance(outcome, Exception):
+                print(f"  └─ ❌ Error: {outcome}")
                 continue
+            
+            print(f"  └─ ✓ Found {outcome['sections']} sections")
+            print(f"  └─ ✓ Created {len(outcome['chunks'])} chunks")
+            chunk_lists.append(outcome['chunks'])
         
-        if not all_chunks:
+        total_chunks = sum(len(chunks) for chunks in chunk_lists)
+        if not total_chunks:
             print("\n❌ No chunks created. Ingestion failed.")
             return
         
-        print(f"\n📊 Total chunks to embed: {len(all_chunks)}")
+        print(f"\n📊 Total chunks to embed: {total_chunks}")
         
-        # 3. Generate embeddings
+        # 3. Generate embeddings in bounded windows, written into one
+        #    preallocated matrix instead of growing Python lists
         print("\n🧮 Generating embeddings...")
-        texts = [chunk['text'] for chunk in all_chunks]
-        embeddings = self.embedding_generator.embed_batch(texts)
-        print(f"✓ Generated {len(embeddings)} embeddings")
-        
-        # 4. Store in vector database
-        print("\n💾 Storing in Endee...")
-        metadatas = [
-            {
-                'text': chunk['text'],
-                'paper_name': chunk['paper_name'],
-                'section_name': chunk['section_name'],
-                'page_number': chunk['page_number'],
-                'chunk_index': chunk['chunk_index']
-            }
-            for chunk in all_chunks
-        ]
-        
-        success = self.vector_store.insert_vectors(
-            vectors=embeddings,
-            metadatas=metadatas,
-            collection=self.collection_name
-        )
+        embeddings, mmap_path = self._allocate_embeddings(total_chunks)
+        try:
+            # Chunk dicts carry exactly the metadata fields stored alongside vectors
+            metadatas = []
+            chunk_stream = chain.from_iterable(chunk_lists)
+            
+            while window := list(islice(chunk_stream, self.embed_window)):
+                # Only one window's embeddings exist outside the buffer at a time
+                start = len(metadatas)
+                embeddings[start:start + len(window)] = self.embedding_generator.embed_batch(
+                    [chunk['text'] for chunk in window]
+                )
+                metadatas.extend(window)
+            print(f"✓ Generated {len(embeddings)} embeddings")
+            
+            # 4. Store in vector database
+            print("\n💾 Storing in Endee...")
+            success = self.vector_store.insert_vectors(
+                vectors=embeddings,
+                metadatas=metadatas,
+                collection=self.collection_name
+            )
+        finally:
+            del embeddings
+            if mmap_path:
+                try:
+                    os.remove(mmap_path)
+                except OSError:
+                    pass
         
         if success:
             print("✓ Successfully stored in vector database")
@@ -153,19 +238,66 @@ class RAGPipeline:
         print("✅ INGESTION COMPLETE")
         print(f"{'='*60}\n")
     
-    def query(self, question: str) -> Dict:
+    def _allocate_embeddings(self, n: int):
+        """
+        Allocate the (n, dimension) float32 ingestion buffer
+        
+        With EMBEDDINGS_MMAP_DIR set, the buffer is a memory-mapped scratch
+        file so large corpora don't grow resident memory.
+        
+        Returns:
+            Tuple of (buffer, scratch file path or None)
+        """
+        shape = (n, self.embedding_generator.get_dimension())
+        if not self.embeddings_mmap_dir:
+            return np.empty(shape, dtype=np.float32), None
+        
+        os.makedirs(self.embeddings_mmap_dir, exist_ok=True)
+        fd, path = tempfile.mkstemp(suffix='.f32', dir=self.embeddings_mmap_dir)
+        os.close(fd)
+        return np.memmap(path, dtype=np.float32, mode='w+', shape=shape), path
+    
+    def embed_question(self, question: str) -> np.ndarray:
+        """
+        Embed a question, reusing the embedding of recent identical questions
+        
+        Args:
+            question: User's question
+            
+        Returns:
+            float32 question embedding
+        """
+        # Called from worker threads; the lock is not held while embedding
+        with self._question_cache_lock:
+            embedding = self._question_cache.get(question)
+            if embedding is not None:
+                self._question_cache.move_to_end(question)
+                return embedding
+        
+        embedding = self.embedding_generator.embed_text(question)
+        if self.question_cache_size > 0:
+            with self._question_cache_lock:
+                self._question_cache[question] = embedding
+                if len(self._question_cache) > self.question_cache_size:
+                    self._question_cache.popitem(last=False)
+        return embedding
+    
+    def query(self, question: str, question_embedding: np.ndarray = None) -> Dict:
         """
         Query the RAG system
         
         Args:
             question: User's question
+            question_embedding: Precomputed embedding of the question, if any
             
         Returns:
-            Dictionary with answer and sources
+            Dictionary with answer, sources and 'generated' (True only
+            when the LLM produced the answer)
         """
         # 1. Embed the question
-        question_embedding = self.embedding_generator.embed_text(question)
-        print(f"   📏 Question embedding dimension: {len(question_embedding)}")
+        if question_embedding is None:
+            question_embedding = self.embed_question(question)
+        print(f"   📏 Question embedding dimension: {question_embedding.shape[0]}")
         
         # 2. Retrieve relevant chunks (try without threshold first for debugging)
         results = self.vector_store.search(
@@ -175,6 +307,90 @@ class RAGPipeline:
             threshold=0.0  # DEBUG: Set to 0 to see all results with scores
         )
         
+        # 3. Prepare context and sources
+        prepared = self._prepare_context(results)
+        if prepared is None:
+            return {
+                'answer': "I couldn't find relevant information in the papers to answer this question.",
+                'sources': [],
+                'generated': False
+            }
+        context, sources = prepared
+        
+        # 4. Generate answer using LLM
+        if self.llm_client:
+            answer, generated = self._generate_answer(question, context)
+        else:
+            # Fallback: return context directly
+            answer = f"Based on the retrieved documents:\n\n{context[:500]}..."
+            generated = False
+        
+        return {
+            'answer': answer,
+            'sources': sources,
+            'generated': generated
+        }
+    
+    async def aquery(self, question: str, question_embedding: np.ndarray = None) -> Dict:
+        """
+        Query the RAG system without blocking the event loop
+        
+        Same as query(), but the vector search and LLM call are awaited on
+        async HTTP clients, so one process can serve many queries concurrently.
+        
+        Args:
+            question: User's question
+            question_embedding: Precomputed embedding of the question, if any
+            
+        Returns:
+            Dictionary with answer, sources and 'generated' (True only
+            when the LLM produced the answer)
+        """
+        # 1. Embed the question (model inference runs in a worker thread)
+        if question_embedding is None:
+            question_embedding = await asyncio.to_thread(self.embed_question, question)
+        
+        # 2. Retrieve relevant chunks
+        results = await self.vector_store.async_search(
+            query_vector=question_embedding,
+            top_k=self.top_k,
+            collection=self.collection_name,
+            threshold=0.0
+        )
+        
+        # 3. Prepare context and sources
+        prepared = self._prepare_context(results)
+        if prepared is None:
+            return {
+                'answer': "I couldn't find relevant information in the papers to answer this question.",
+                'sources': [],
+                'generated': False
+            }
+        context, sources = prepared
+        
+        # 4. Generate answer using LLM
+        if self.llm_client:
+            answer, generated = await self._agenerate_answer(question, context)
+        else:
+            answer = f"Based on the retrieved documents:\n\n{context[:500]}..."
+            generated = False
+        
+        return {
+            'answer': answer,
+            'sources': sources,
+            'generated': generated
+        }
+    
+    def _prepare_context(self, results: List[Dict]):
+        """
+        Filter search results by similarity and build the LLM context
+        
+        Args:
+            results: Search results, best first
+            
+        Returns:
+            Tuple of (context, sources), or None if no result passes the threshold
+        """
         print(f"   🔎 Found {len(results)} results from search")
         if results:
             print(f"   📊 Top similarity scores: {[f'{r['similarity']:.3f}' for r in results[:3]]}")
@@ -187,17 +403,22 @@ class RAGPipeline:
             if results:
                 print(f"   ⚠️  All {len(results)} results below threshold {self.similarity_threshold}")
                 print(f"   💡 Highest similarity was: {results[0]['similarity']:.3f}")
-            return {
-                'answer': "I couldn't find relevant information in the papers to answer this question.",
-                'sources': []
-            }
+            return None
         
-        # 3. Prepare context and sources
         context_chunks = []
         sources = []
+        seen = set()
         
         for result in filtered_results:
             metadata = result['metadata']
+            
+            # Skip repeated chunk texts; results are best first, so the
+            # highest-similarity copy is the one kept
+            digest = hashlib.blake2b(metadata['text'].encode('utf-8'), digest_size=8).digest()
+            if digest in seen:
+                continue
+            seen.add(digest)
+            
             similarity = result['similarity']
             
             context_chunks.append(
@@ -212,21 +433,19 @@ class RAGPipeline:
                 'similarity_score': similarity
             })
         
-        context = "\n\n".join(context_chunks)
-        
-        # 4. Generate answer using LLM
-        if self.llm_client:
-            answer = self._generate_answer(question, context)
-        else:
-            # Fallback: return context directly
-            answer = f"Based on the retrieved documents:\n\n{context[:500]}..."
+        return "\n\n".join(context_chunks), sources
+    
+    def _build_prompts(self, question: str, context: str):
+        """
+        Build the system and user prompts for a question
         
-        return {
-            'answer': answer,
-            'sources': sources
-        }
+        Returns:
+            Tuple of (system_prompt, user_prompt)
+        """
+        user_prompt = self._user_template.format(question=question, context=context)
+        return self._system_prompt, user_prompt
     
-    def _generate_answer(self, question: str, context: str) -> str:
+    def _generate_answer(self, question: str, context: str) -> Tuple[str, bool]:
         """
         Generate answer using LLM
         
@@ -235,31 +454,11 @@ class RAGPipeline:
             context: Retrieved context
             
         Returns:
-            Generated answer
+            Tuple of (answer, whether the LLM generated it); on an LLM error
+            the answer is the retrieved context instead
         """
-        system_prompt = """You are a helpful and knowledgeable research assistant. Your goal is to provide useful insights from research papers.
-
-GUIDELINES:
-1. ALWAYS try to provide a helpful answer based on the available context
-2. Synthesize information from the context to answer the question as best as you can
-3. Use bullet points or numbered lists for clarity
-4. Quote specific findings, methods, or contributions when they're explicitly mentioned
-5. If the context has partial or related information, use it! Don't refuse to answer
-6. Be conversational and friendly, not overly cautious
-7. Only say you cannot answer if there is truly ZERO relevant information in the context
-8. Base all answers strictly on the provided context - no external knowledge"""
-
-        user_prompt = f"""Question: {question}
-
-Context from research papers:
-{context}
-
-Based on the context above, please provide a helpful answer to the question. 
-Synthesize the information and present it clearly using bullet points or numbered lists when appropriate.
-Be specific and quote relevant findings when they're explicitly stated.
-
-Answer:"""
-
+        system_prompt, user_prompt = self._build_prompts(question, context)
+        
         try:
             if self.llm_provider == 'openai':
                 response = self.llm_client.chat.completions.create(
@@ -271,7 +470,7 @@ Answer:"""
                     temperature=0.3,  # Lower temperature for more focused answers
                     max_tokens=500
                 )
-                return response.choices[0].message.content.strip()
+                return response.choices[0].message.content.strip(), True
             
             elif self.llm_provider == 'gemini':
                 # Combine system and user prompts for Gemini
@@ -285,11 +484,56 @@ Answer:"""
                         'max_output_tokens': 500,
                     }
                 )
-                return response.text.strip()
+                return response.text.strip(), True
+        
+        except Exception as e:
+            print(f"Error generating answer: {e}")
+            return f"Retrieved context:\n\n{context[:500]}...", False
+    
+    async def _agenerate_answer(self, question: str, context: str) -> Tuple[str, bool]:
+        """
+        Generate answer using the LLM's async client
+        
+        Args:
+            question: User's question
+            context: Retrieved context
+            
+        Returns:
+            Tuple of (answer, whether the LLM generated it); on an LLM error
+            the answer is the retrieved context instead
+        """
+        system_prompt, user_prompt = self._build_prompts(question, context)
+        
+        try:
+            if self.llm_provider == 'openai':
+                response = await self.async_llm_client.chat.completions.create(
+                    model=self.llm_model,
+                    messages=[
+                        {"role": "system", "content": system_prompt},
+                        {"role": "user", "content": user_prompt}
+                    ],
+                    temperature=0.3,  # Lower temperature for more focused answers
+                    max_tokens=500
+                )
+                return response.choices[0].message.content.strip(), True
+            
+            elif self.llm_provider == 'gemini':
+                # Combine system and user prompts for Gemini
+                full_prompt = f"{system_prompt}\n\n{user_prompt}"
+                
+                response = await self.llm_client.aio.models.generate_content(
+                    model=self.llm_model,
+                    contents=full_prompt,
+                    config={
+                        'temperature': 0.3,
+                        'max_output_tokens': 500,
+                    }
+                )
+                return response.text.strip(), True
         
         except Exception as e:
             print(f"Error generating answer: {e}")
-            return f"Retrieved context:\n\n{context[:500]}..."
+            return f"Retrieved context:\n\n{context[:500]}...", False
 
 
 # Example usage
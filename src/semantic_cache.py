@@ -0,0 +1,148 @@
+"""
+Semantic Cache Module
+Approximate answer cache for repeated or paraphrased questions
+"""
+
+from typing import Dict, Optional
+import numpy as np
+
+
+_M1 = np.uint64(0x5555555555555555)
+_M2 = np.uint64(0x3333333333333333)
+_M4 = np.uint64(0x0F0F0F0F0F0F0F0F)
+_H01 = np.uint64(0x0101010101010101)
+
+
+def _popcount64(x: np.ndarray) -> np.ndarray:
+    """Branchless SWAR population count over an array of uint64"""
+    x = x - ((x >> np.uint64(1)) & _M1)
+    x = (x & _M2) + ((x >> np.uint64(2)) & _M2)
+    x = (x + (x >> np.uint64(4))) & _M4
+    return (x * _H01) >> np.uint64(56)
+
+
+class SemanticCache:
+    """
+    Answer cache keyed by query embedding
+
+    Each query vector gets a 64-bit random-projection signature (one sign bit
+    per projection), packed into a uint64. Lookups XOR the query signature
+    against all cached signatures and popcount the result, so only the few
+    entries with the smallest Hamming distance are compared by cosine
+    similarity. A candidate is a hit when that similarity reaches the threshold.
+    """
+
+    NUM_BITS = 64
+
+    def __init__(
+        self,
+        dimension: int,
+        threshold: float = 0.95,
+        max_entries: int = 1024,
+        candidates: int = 8,
+        seed: int = 0
+    ):
+        """
+        Initialize semantic cache
+
+        Args:
+            dimension: Embedding dimension
+            threshold: Minimum cosine similarity for a cache hit
+            max_entries: Maximum cached answers before the oldest is evicted
+                (0 disables the cache)
+            candidates: Entries re-scored by cosine similarity per lookup
+            seed: Seed for the projection matrix
+        """
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.candidates = candidates
+
+        rng = np.random.default_rng(seed)
+        self._projections = rng.standard_normal((self.NUM_BITS, dimension)).astype(np.float32)
+
+        # Ring buffer of entries; the oldest slot is overwritten once full
+        self._signatures = np.zeros(max_entries, dtype=np.uint64)
+        self._vectors = np.zeros((max_entries, dimension), dtype=np.float16)
+        self._results = [None] * max_entries
+        self._size = 0
+        self._next = 0
+
+    def _normalize(self, vector: np.ndarray) -> np.ndarray:
+        """Return a unit-length float32 copy of the vector"""
+        v = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(v)
+        return v / norm if norm > 0 else v
+
+    def _signature(self, vector: np.ndarray) -> np.uint64:
+        """Pack the signs of the 64 projections into one uint64"""
+        return np.packbits((self._projections @ vector) > 0).view(np.uint64)[0]
+
+    def get(self, query_vector: np.ndarray) -> Optional[Dict]:
+        """
+        Look up a cached result for a query
+
+        Args:
+            query_vector: Query embedding
+
+        Returns:
+            Cached result, or None on a miss
+        """
+        if not self._size:
+            return None
+
+        q = self._normalize(query_vector)
+        distances = _popcount64(self._signatures[:self._size] ^ self._signature(q))
+
+        k = min(self.candidates, self._size)
+        nearest = np.argpartition(distances, k - 1)[:k]
+        sims = self._vectors[nearest].astype(np.float32) @ q
+
+        best = int(np.argmax(sims))
+        if sims[best] < self.threshold:
+            return None
+        return self._results[nearest[best]]
+
+    def put(self, query_vector: np.ndarray, result: Dict):
+        """
+        Cache a result for a query
+
+        Args:
+            query_vector: Query embedding
+            result: Result to return for similar queries
+        """
+        if self.max_entries <= 0:
+            return
+        
+        q = self._normalize(query_vector)
+        slot = self._next
+
+        self._signatures[slot] = self._signature(q)
+        self._vectors[slot] = q
+        self._results[slot] = result
+
+        self._next = (slot + 1) % self.max_entries
+        self._size = min(self._size + 1, self.max_entries)
+
+    def clear(self):
+        """Drop all cached results"""
+        self._results = [None] * self.max_entries
+        self._size = 0
+        self._next = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+
+# Example usage
+if __name__ == "__main__":
+    rng = np.random.default_rng(42)
+    cache = SemanticCache(dimension=384)
+
+    query = rng.standard_normal(384).astype(np.float32)
+    cache.put(query, {'answer': 'cached answer', 'sources': []})
+
+    paraphrase = query + 0.05 * rng.standard_normal(384).astype(np.float32)
+    unrelated = rng.standard_normal(384).astype(np.float32)
+
+    print(f"Paraphrase hit: {cache.get(paraphrase) is not None}")
+    print(f"Unrelated hit: {cache.get(unrelated) is not None}")